@@ -6,20 +6,116 @@ funding_url: https://github.com/open-webui
 version: 0.4.0
 required_open_webui_version: 0.3.17
 license: MIT
+requirements: httpx[http2]
 """
 
 import os
-import requests
+import asyncio
+import functools
+import httpx
 import json
 import logging
-from typing import List, Union, Generator, Iterator
+import time
+from collections import OrderedDict, deque
+from typing import List, Optional, Tuple, Union, AsyncGenerator, Iterator
 from pydantic import BaseModel, Field
 from open_webui.utils.misc import pop_system_message
 
+
+def _json_default(obj):
+    """Serialize bytes values (base64 image data) as ASCII strings."""
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        return bytes(obj).decode("ascii")
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+try:
+    import orjson
+
+    _json_loads = orjson.loads
+
+    def _json_dumps(obj) -> bytes:
+        return orjson.dumps(obj, default=_json_default)
+except ImportError:
+    _json_loads = json.loads
+
+    def _json_dumps(obj) -> bytes:
+        return json.dumps(obj, default=_json_default).encode("utf-8")
+
 # Configure logging
 logger = logging.getLogger(__name__)
 
 
+@functools.lru_cache(maxsize=64)
+def _extract_model_id_cached(model_string: str) -> str:
+    # If contains ".", extract part after it (e.g., "anthropic.claude-opus-4-5")
+    if "." in model_string:
+        return model_string.split(".", 1)[1]
+
+    # Otherwise use as-is
+    return model_string
+
+
+def _b64_decoded_size(data: Union[str, bytes]) -> int:
+    """Return the decoded byte length of a base64 string."""
+    pad = data[-2:].count(b"=" if isinstance(data, bytes) else "=")
+    return (len(data) * 3 >> 2) - pad
+
+
+def _extract_text_bytes(line: bytes) -> Optional[bytes]:
+    """Slice the delta text out of a compact text_delta SSE line.
+
+    Returns None when the value contains escape sequences or the line is
+    not in the expected shape, in which case the caller must parse it.
+    """
+    start = line.find(b'"text":"')
+    if start < 0:
+        return None
+    start += 8
+    end = line.find(b'"', start)
+    if end < 0:
+        return None
+    text = line[start:end]
+    if b"\\" in text:
+        return None
+    return text
+
+
+async def _read_chunks(
+    response: httpx.Response, chunks: deque, arrived: asyncio.Event
+) -> None:
+    """Feed raw network chunks into chunks, ending with a None sentinel.
+
+    Reads undecoded chunks, so the request must ask for an identity-encoded
+    response. Sets arrived whenever something is appended.
+    """
+    try:
+        async for chunk in response.aiter_raw():
+            chunks.append(chunk)
+            arrived.set()
+    finally:
+        chunks.append(None)
+        arrived.set()
+
+
+def _split_lines(buf: bytearray, chunk: bytes) -> Iterator[bytes]:
+    """Append chunk to buf and yield its complete SSE lines as bytes.
+
+    Bytes after the last newline stay in buf for the next chunk.
+    """
+    # Bytes left over from the previous chunk hold no newline
+    scan = len(buf)
+    buf += chunk
+    start = 0
+    with memoryview(buf) as view:
+        while (nl := buf.find(b"\n", scan)) >= 0:
+            end = nl - 1 if nl > start and buf[nl - 1] == 0x0D else nl
+            yield bytes(view[start:end])
+            start = scan = nl + 1
+    # Drop consumed lines once per chunk rather than once per line
+    del buf[:start]
+
+
 class Pipe:
     class Valves(BaseModel):
         ANTHROPIC_API_KEY: str = Field(
@@ -40,12 +136,32 @@ class Pipe:
         )
         REQUEST_TIMEOUT: int = Field(
             default=60,
-            description="Request timeout in seconds"
+            description="Request timeout in seconds (streaming reads use INTER_CHUNK_TIMEOUT)"
         )
         CONNECTION_TIMEOUT: float = Field(
             default=3.05,
             description="Connection timeout in seconds"
         )
+        VERIFY_URL_IMAGES: bool = Field(
+            default=False,
+            description="Check URL image sizes with HEAD requests before sending"
+        )
+        INTER_CHUNK_TIMEOUT: float = Field(
+            default=30.0,
+            description="Abort a stream if the response headers or the next chunk take longer than this many seconds"
+        )
+        STREAM_COALESCE_BYTES: int = Field(
+            default=16384,
+            description="Flush buffered stream text at this size (characters, or bytes with YIELD_BYTES)"
+        )
+        STREAM_COALESCE_MS: float = Field(
+            default=20.0,
+            description="Flush buffered stream text at least this often (milliseconds)"
+        )
+        YIELD_BYTES: bool = Field(
+            default=False,
+            description="Stream UTF-8 bytes instead of str (only if the consumer accepts bytes)"
+        )
 
     def __init__(self):
         self.type = "manifold"
@@ -56,13 +172,50 @@ class Pipe:
         )
         self.MAX_IMAGE_SIZE = 5 * 1024 * 1024  # 5MB per image
         self.MAX_TOTAL_IMAGE_SIZE = 100 * 1024 * 1024  # 100MB total
-
-    def get_anthropic_models(self):
-        return [
+        self.URL_SIZE_CACHE_SIZE = 256  # HEAD results kept across turns
+        self._url_size_cache: "OrderedDict[str, int]" = OrderedDict()
+        self._models = [
             {"id": "claude-sonnet-4-5-20250929", "name": "claude-sonnet-4.5"},
             {"id": "claude-haiku-4-5-20251001", "name": "claude-haiku-4.5"},
             {"id": "claude-opus-4-5-20251101", "name": "claude-opus-4.5"},
         ]
+        self._base_headers: dict = {}
+        # Shared keep-alive pool; timeouts are passed per request so valve
+        # changes made after construction still take effect.
+        # HTTP/2 multiplexes concurrent streams, and asyncio already sets
+        # TCP_NODELAY on its TCP transports, so no socket options are needed.
+        # Passing a custom transport would also make httpx ignore the
+        # HTTPS_PROXY/HTTP_PROXY environment variables.
+        self._client = httpx.AsyncClient(
+            http2=True,
+            # Keep idle connections for 60s (httpx default is 5s) so they
+            # survive the gap between chat turns
+            limits=httpx.Limits(
+                max_connections=100,
+                max_keepalive_connections=20,
+                keepalive_expiry=60,
+            ),
+        )
+
+    def _timeout(self, read: Optional[float] = None) -> httpx.Timeout:
+        return httpx.Timeout(
+            self.valves.REQUEST_TIMEOUT,
+            connect=self.valves.CONNECTION_TIMEOUT,
+            read=self.valves.REQUEST_TIMEOUT if read is None else read,
+        )
+
+    def _get_base_headers(self) -> dict:
+        """Return the static request headers, rebuilt only if the API version valve changes."""
+        version = self.valves.ANTHROPIC_API_VERSION
+        if self._base_headers.get("anthropic-version") != version:
+            self._base_headers = {
+                "anthropic-version": version,
+                "content-type": "application/json",
+            }
+        return self._base_headers
+
+    def get_anthropic_models(self):
+        return self._models
 
     def pipes(self) -> List[dict]:
         return self.get_anthropic_models()
@@ -71,26 +224,37 @@ class Pipe:
         """Extract model ID from model string, handling various formats."""
         if not model_string:
             raise ValueError("Model string is empty")
-        
-        # If contains ".", extract part after it (e.g., "anthropic.claude-opus-4-5")
-        if "." in model_string:
-            return model_string.split(".", 1)[1]
-        
-        # Otherwise use as-is
-        return model_string
 
-    def process_image(self, image_data: dict) -> dict:
-        """Process image data with size validation."""
+        return _extract_model_id_cached(model_string)
+
+    def process_image(self, image_data: dict) -> Tuple[dict, Optional[int]]:
+        """Process image data with size validation.
+
+        Returns the Anthropic image block and its decoded size in bytes
+        (None for URL images). Data URLs given as bytes keep their payload
+        as bytes; it is converted to text only when the request body is
+        serialized.
+        """
         try:
             url = image_data["image_url"]["url"]
-            
-            if url.startswith("data:image"):
+            is_bytes = isinstance(url, bytes)
+
+            if url.startswith(b"data:image" if is_bytes else "data:image"):
                 # Base64 encoded image
-                mime_type, base64_data = url.split(",", 1)
-                media_type = mime_type.split(":")[1].split(";")[0]
+                # Slice around the comma instead of split() to avoid the
+                # intermediate list and header re-splitting on large payloads
+                comma = url.find(b"," if is_bytes else ",")
+                if comma < 0:
+                    raise ValueError("Malformed data URL: missing ','")
+                mime_type = url[:comma]  # e.g. "data:image/png;base64"
+                if is_bytes:
+                    mime_type = mime_type.decode("ascii")
+                base64_data = url[comma + 1 :]
+                semicolon = mime_type.find(";")
+                media_type = mime_type[5:semicolon if semicolon >= 0 else None]
 
                 # Check base64 image size
-                image_size = len(base64_data) * 3 / 4
+                image_size = _b64_decoded_size(base64_data)
                 if image_size > self.MAX_IMAGE_SIZE:
                     raise ValueError(
                         f"Image size exceeds 5MB limit: {image_size / (1024 * 1024):.2f}MB"
@@ -103,30 +267,68 @@ class Pipe:
                         "media_type": media_type,
                         "data": base64_data,
                     },
-                }
+                }, image_size
             else:
-                # URL image - check size
-                try:
-                    response = requests.head(url, allow_redirects=True, timeout=5)
-                    content_length = int(response.headers.get("content-length", 0))
-
-                    if content_length > self.MAX_IMAGE_SIZE:
-                        raise ValueError(
-                            f"Image at URL exceeds 5MB limit: {content_length / (1024 * 1024):.2f}MB"
-                        )
-                except requests.RequestException as e:
-                    logger.warning(f"Could not verify image size at {url}: {e}")
-                    # Continue anyway - Anthropic will validate
-
+                # URL image - size is checked in bulk by _verify_url_images
+                if is_bytes:
+                    url = url.decode("utf-8")
                 return {
                     "type": "image",
                     "source": {"type": "url", "url": url},
-                }
+                }, None
         except (KeyError, ValueError) as e:
             logger.error(f"Error processing image: {e}")
             raise
 
-    def pipe(self, body: dict) -> Union[str, Generator, Iterator]:
+    async def _check_url_image_size(self, url: str) -> None:
+        """Check the size of a URL image with a HEAD request.
+
+        Successful results are cached per URL, so an image re-sent with
+        every turn of a conversation is only probed once.
+        """
+        content_length = self._url_size_cache.get(url)
+        if content_length is not None:
+            self._url_size_cache.move_to_end(url)
+        else:
+            try:
+                response = await self._client.head(
+                    url, follow_redirects=True, timeout=5
+                )
+                content_length = int(response.headers.get("content-length", 0))
+            except (httpx.HTTPError, httpx.InvalidURL) as e:
+                logger.warning(f"Could not verify image size at {url}: {e}")
+                # Continue anyway - Anthropic will validate
+                return
+
+            self._url_size_cache[url] = content_length
+            if len(self._url_size_cache) > self.URL_SIZE_CACHE_SIZE:
+                self._url_size_cache.popitem(last=False)
+
+        if content_length > self.MAX_IMAGE_SIZE:
+            raise ValueError(
+                f"Image at URL exceeds 5MB limit: {content_length / (1024 * 1024):.2f}MB"
+            )
+
+    async def _verify_url_images(self, urls: List[str]) -> None:
+        """Run the HEAD size checks for all URL images concurrently."""
+        # Bound the fan-out so a message with many images does not open
+        # a connection per image at once
+        semaphore = asyncio.Semaphore(8)
+
+        async def check(url: str) -> None:
+            async with semaphore:
+                await self._check_url_image_size(url)
+
+        # Let every probe finish before reporting the first failure, so no
+        # task is left running unobserved
+        results = await asyncio.gather(
+            *(check(url) for url in urls), return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+    async def pipe(self, body: dict) -> Union[str, AsyncGenerator]:
         # Validate API key
         if not self.valves.ANTHROPIC_API_KEY:
             return "Error: ANTHROPIC_API_KEY not configured"
@@ -135,22 +337,34 @@ class Pipe:
 
         processed_messages = []
         total_image_size = 0
+        image_urls = []
+
+        process_image = self.process_image
 
         for message in messages:
+            content = message.get("content", "")
+
+            # Plain-text messages already match Anthropic's schema
+            if isinstance(content, str):
+                processed_messages.append({"role": message["role"], "content": content})
+                continue
+
             processed_content = []
-            
-            if isinstance(message.get("content"), list):
-                for item in message["content"]:
+
+            if isinstance(content, list):
+                for item in content:
                     if item["type"] == "text":
                         processed_content.append({"type": "text", "text": item["text"]})
                     elif item["type"] == "image_url":
                         try:
-                            processed_image = self.process_image(item)
+                            processed_image, image_size = process_image(item)
                             processed_content.append(processed_image)
 
+                            if processed_image["source"]["type"] == "url":
+                                image_urls.append(processed_image["source"]["url"])
+
                             # Track total size for base64 images
-                            if processed_image["source"]["type"] == "base64":
-                                image_size = len(processed_image["source"]["data"]) * 3 / 4
+                            if image_size is not None:
                                 total_image_size += image_size
                                 if total_image_size > self.MAX_TOTAL_IMAGE_SIZE:
                                     raise ValueError(
@@ -160,14 +374,19 @@ class Pipe:
                             logger.error(f"Failed to process image: {e}")
                             return f"Error: Failed to process image: {e}"
             else:
-                processed_content = [
-                    {"type": "text", "text": message.get("content", "")}
-                ]
+                processed_content = [{"type": "text", "text": content}]
 
             processed_messages.append(
                 {"role": message["role"], "content": processed_content}
             )
 
+        if image_urls and self.valves.VERIFY_URL_IMAGES:
+            try:
+                await self._verify_url_images(image_urls)
+            except ValueError as e:
+                logger.error(f"Failed to process image: {e}")
+                return f"Error: Failed to process image: {e}"
+
         # Build payload
         try:
             model_id = self._extract_model_id(body["model"])
@@ -189,79 +408,186 @@ class Pipe:
         if system_message:
             payload["system"] = str(system_message)
 
-        headers = {
-            "x-api-key": self.valves.ANTHROPIC_API_KEY,
-            "anthropic-version": self.valves.ANTHROPIC_API_VERSION,
-            "content-type": "application/json",
-        }
+        headers = {**self._get_base_headers(), "x-api-key": self.valves.ANTHROPIC_API_KEY}
 
         url = "https://api.anthropic.com/v1/messages"
 
         try:
+            # Serialize once; the request helpers only keep the encoded body
+            data = _json_dumps(payload)
             if body.get("stream", False):
-                return self.stream_response(url, headers, payload)
+                return self.stream_response(url, headers, data)
             else:
-                return self.non_stream_response(url, headers, payload)
-        except requests.exceptions.RequestException as e:
+                return await self.non_stream_response(url, headers, data)
+        except httpx.HTTPError as e:
             logger.error(f"Request failed: {e}")
             return f"Error: Request failed: {e}"
         except Exception as e:
             logger.error(f"Error in pipe method: {e}")
             return f"Error: {e}"
 
-    def stream_response(self, url: str, headers: dict, payload: dict) -> Generator:
-        """Handle streaming response from Anthropic API."""
+    async def stream_response(
+        self, url: str, headers: dict, data: bytes
+    ) -> AsyncGenerator:
+        """Handle streaming response from Anthropic API.
+
+        Text deltas are coalesced and flushed once STREAM_COALESCE_BYTES
+        characters (bytes with YIELD_BYTES) are buffered or, at the latest,
+        STREAM_COALESCE_MS after the previous flush, so downstream sees
+        fewer, larger writes. With YIELD_BYTES, text is
+        yielded as UTF-8 bytes sliced straight from the SSE line when no
+        JSON unescaping is needed.
+        """
+        yield_bytes = self.valves.YIELD_BYTES
+        join = b"".join if yield_bytes else "".join
+        buffer = []
+        buffered = 0
+        max_buffered = self.valves.STREAM_COALESCE_BYTES
+        max_delay = self.valves.STREAM_COALESCE_MS / 1000
+        last_flush = time.monotonic()
+        error = None
+
         try:
-            timeout = (self.valves.CONNECTION_TIMEOUT, self.valves.REQUEST_TIMEOUT)
-            
-            with requests.post(
-                url, headers=headers, json=payload, stream=True, timeout=timeout
+            async with self._client.stream(
+                "POST",
+                url,
+                headers={**headers, "accept-encoding": "identity"},
+                content=data,
+                # httpx's read timeout bounds the gap between network chunks
+                timeout=self._timeout(read=self.valves.INTER_CHUNK_TIMEOUT),
             ) as response:
                 if response.status_code != 200:
+                    await response.aread()
                     error_text = response.text
                     logger.error(f"HTTP {response.status_code}: {error_text}")
-                    yield f"Error: HTTP {response.status_code}: {error_text}"
+                    error = f"Error: HTTP {response.status_code}: {error_text}"
+                    yield error.encode("utf-8") if yield_bytes else error
                     return
 
-                for line in response.iter_lines():
-                    if line:
-                        line = line.decode("utf-8")
-                        if line.startswith("data: "):
-                            try:
-                                data = json.loads(line[6:])
-                                
-                                # Handle different event types
-                                if data["type"] == "content_block_delta":
-                                    if "delta" in data and "text" in data["delta"]:
-                                        yield data["delta"]["text"]
-                                
-                                elif data["type"] == "message_stop":
+                # Local aliases for the per-event hot loop
+                loads = _json_loads
+                warn = logger.warning
+                monotonic = time.monotonic
+                append = buffer.append
+                prefix = b"data: "
+                delta_marker = b'"content_block_delta"'
+                stop_marker = b'"message_stop"'
+
+                # A single reader task buffers network chunks, so lines that
+                # have already arrived are handled without awaiting, and the
+                # loop only waits when it needs more data.
+                chunks = deque()
+                arrived = asyncio.Event()
+                reader = asyncio.create_task(_read_chunks(response, chunks, arrived))
+                loop = asyncio.get_running_loop()
+                buf = bytearray()
+                stopped = False
+                try:
+                    while not stopped:
+                        if not chunks:
+                            arrived.clear()
+                            # With text buffered, also wake at the flush
+                            # deadline so a pause upstream (pings, thinking,
+                            # slow generation) never holds it back.
+                            timer = None
+                            if buffer:
+                                timer = loop.call_later(
+                                    max(last_flush + max_delay - monotonic(), 0),
+                                    arrived.set,
+                                )
+                            await arrived.wait()
+                            if timer is not None:
+                                timer.cancel()
+                            if not chunks:
+                                yield join(buffer)
+                                buffer.clear()
+                                buffered = 0
+                                last_flush = monotonic()
+                                continue
+
+                        chunk = chunks.popleft()
+                        if chunk is None:
+                            # Re-raise read errors such as httpx.ReadTimeout
+                            await reader
+                            if not buf:
+                                break
+                            # Terminate a trailing unterminated line
+                            chunk = b"\n"
+                            stopped = True
+
+                        for line in _split_lines(buf, chunk):
+                            if not line.startswith(prefix):
+                                continue
+
+                            # Match the event type on raw bytes so events we ignore
+                            # (message_start, ping, content_block_start, ...) are
+                            # never parsed. Quotes inside text values are escaped,
+                            # so a delta's text cannot produce a false match.
+                            if delta_marker not in line:
+                                if stop_marker in line:
+                                    stopped = True
                                     break
-                                
-                                # Ignore content_block_start, message_start, etc.
-                                
-                            except json.JSONDecodeError as e:
-                                logger.warning(f"Failed to parse JSON: {line[:100]}")
-                            except KeyError as e:
-                                logger.warning(f"Unexpected data structure: {e}")
-                                
-        except requests.exceptions.Timeout:
+                                continue
+
+                            text = None
+                            if yield_bytes and b'"text_delta"' in line:
+                                text = _extract_text_bytes(line)
+
+                            if text is None:
+                                try:
+                                    event = loads(line[6:])
+                                except json.JSONDecodeError:
+                                    warn(f"Failed to parse JSON: {line[:100]!r}")
+                                    continue
+
+                                if event.get("type") != "content_block_delta":
+                                    continue
+                                delta = event.get("delta")
+                                if delta is None or (text := delta.get("text")) is None:
+                                    continue
+                                if yield_bytes:
+                                    text = text.encode("utf-8")
+
+                            append(text)
+                            buffered += len(text)
+                            now = monotonic()
+                            if buffered >= max_buffered or now - last_flush >= max_delay:
+                                yield join(buffer)
+                                buffer.clear()
+                                buffered = 0
+                                last_flush = now
+                finally:
+                    if not reader.done():
+                        reader.cancel()
+                    await asyncio.gather(reader, return_exceptions=True)
+
+        except httpx.ReadTimeout:
+            logger.error("Stream stalled")
+            error = f"Error: No data received for {self.valves.INTER_CHUNK_TIMEOUT}s"
+        except httpx.TimeoutException:
             logger.error("Request timeout")
-            yield "Error: Request timeout"
-        except requests.exceptions.RequestException as e:
+            error = "Error: Request timeout"
+        except httpx.HTTPError as e:
             logger.error(f"Request failed: {e}")
-            yield f"Error: Request failed: {e}"
+            error = f"Error: Request failed: {e}"
         except Exception as e:
             logger.error(f"Stream error: {e}")
-            yield f"Error: {e}"
+            error = f"Error: {e}"
 
-    def non_stream_response(self, url: str, headers: dict, payload: dict) -> str:
+        # Flush any text still buffered, including before an error message
+        if buffer:
+            yield join(buffer)
+        if error:
+            yield error.encode("utf-8") if yield_bytes else error
+
+    async def non_stream_response(self, url: str, headers: dict, data: bytes) -> str:
         """Handle non-streaming response from Anthropic API."""
         try:
-            timeout = (self.valves.CONNECTION_TIMEOUT, self.valves.REQUEST_TIMEOUT)
-            
-            response = requests.post(
-                url, headers=headers, json=payload, timeout=timeout
+            response = await self._client.post(
+                url,
+                headers=headers,
+                content=data,
+                timeout=self._timeout(),
             )
             
             if response.status_code != 200:
@@ -269,7 +595,7 @@ class Pipe:
                 logger.error(f"HTTP {response.status_code}: {error_text}")
                 return f"Error: HTTP {response.status_code}: {error_text}"
 
-            res = response.json()
+            res = _json_loads(response.content)
             
             # Extract text from response
             if "content" in res and res["content"]:
@@ -279,10 +605,10 @@ class Pipe:
             
             return ""
             
-        except requests.exceptions.Timeout:
+        except httpx.TimeoutException:
             logger.error("Request timeout")
             return "Error: Request timeout"
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             logger.error(f"Request failed: {e}")
             return f"Error: {e}"
         except Exception as e: